@@ -5,16 +5,28 @@ Created on Wed Jul 29 10:19:17 2020
 
 @author: annamoragne
 """
+import os
+import warnings
 import networkx as nx
 import numpy as np
-import math
-from scipy.integrate import solve_ivp
+try: #numba kernels for the SEIR model
+    from seir_aot import integrate, integrate_stiff, sweep
+except ImportError: #without numba, use the Cython build of the same kernels, see seir_deriv.pyx
+    from seir_deriv import integrate, integrate_stiff, sweep
+try: #ahead-of-time compiled SEIR integrator, built by running seir_aot.py
+    from seir_aot_ext import integrate
+except ImportError:
+    pass
+if os.environ.get("SEIR_USE_JULIA")=="1": #opt in to Julia's DifferentialEquations, needs diffeqpy and Julia installed
+    try:
+        from seir_diffeq import integrate, sweep
+    except Exception as e: #installing or compiling Julia can fail in many ways, keep the kernels above if it does
+        warnings.warn("Julia solver unavailable, using the default SEIR integrator: %s" % e)
 from bokeh.io import curdoc
 from bokeh.layouts import row, column
-from bokeh.models import (ColumnDataSource, Slider, TableColumn, DataTable, Button, Panel, Tabs, GraphRenderer, Div, Arrow, OpenHead, 
+from bokeh.models import (ColumnDataSource, Slider, TableColumn, DataTable, Button, Panel, Tabs, Div, Arrow, OpenHead, CustomJS, 
                           BoxSelectTool, Circle, EdgesAndLinkedNodes, HoverTool, MultiLine, NodesAndLinkedEdges, Plot, Range1d, TapTool, ResetTool)
 from bokeh.plotting import figure
-from math import exp
 from bokeh.palettes import Spectral4, Colorblind8
 from bokeh.models.graphs import from_networkx
 from bokeh.models.annotations import LabelSet
@@ -56,44 +68,17 @@ health_capacity=150 #number of people the hospital can handle at one time in the
 hcd=1 #health capacity effecting the death rate
 hcr=1 #health capacity effecting the recovery rate
 # A grid of time points (in days)
-t = np.linspace(0, 365, 365) #365 days
+t = np.linspace(0, 365, 366) #365 days, one point per day so day d is t[d]
 t_vac=365 #time at which vaccine is introduced
 
-def vac_freq(t_vac, current_time, vaccination_rate): #function that gives the vaccine rate, it will be 0 before the vaccine is introduced and 0.01 after the vaccine is introduced
-    #vf=(.01*exp(10*(current_time-t_vac)))/(1+exp(10*(current_time-t_vac)))
-    vf=vaccination_rate*(math.atan(current_time-t_vac)+(math.pi/2))
-    return vf
-
-def health_cap_effect(health_capacity, Is_h): #function that shows death rates and recovery rates being effected if hospital capacity is surpased
-    diff=(health_capacity-Is_h)
-    hcd=1+((0.5*exp(-diff))/(1+exp(-diff)))
-    hcr=0.7+((0.3*exp(diff))/(1+exp(diff)))
-    return hcd, hcr    
-
-# The SIR model differential equations.
-def deriv(t, y, N, vaccination_rate, beta_A_uk, beta_A_k, beta_S_nh, beta_S_h, gamma, gamma_hosp, nat_death, death_rate_S, death_rate_hosp, E_to_I_forA, E_to_I_forS, return_rate, sd, test_rate_inc, t_vac, health_capacity):
-    S, E, Ia_uk, Ia_k, Is_nh, Is_h, R, D = y
-    v_freq=vac_freq(t_vac, t, vaccination_rate)
-    test_rate=.001*t*test_rate_inc
-    hce=health_cap_effect(health_capacity, Is_h)
-    #below are the 8 ODEs for each of the 8 classes 
-    dSdt = (-beta_S_nh * sd* S * Is_nh / N)-(beta_S_h * S * Is_h / N)-(beta_A_uk * sd * S * Ia_uk / N)-(beta_A_k * sd * S * Ia_k / N)-(nat_death*S)+(nat_birth*(N-D))+(return_rate*R)-(v_freq*v_eff*S)
-    dEdt = (beta_S_nh * sd* S * Is_nh / N)+(beta_S_h * S * Is_h / N)+(beta_A_uk * sd * S * Ia_uk / N)+(beta_A_k * sd * S * Ia_k / N) - (E_to_I_forA * E)-(E_to_I_forS*E)-(nat_death*E)
-    dIa_uk_dt= (E_to_I_forA*E)-(nat_death*Ia_uk)-(gamma*Ia_uk)-(test_rate*Ia_uk)
-    dIa_k_dt =(test_rate*Ia_uk)-(nat_death*Ia_k)-(gamma*Ia_k)
-    dIs_nh_dt = (E_to_I_forS*E)-(nat_death*Is_nh)-(death_rate_S*Is_nh)-(gamma*Is_nh)-(hosp*Is_nh)
-    dIs_h_dt = (hosp*Is_nh)-(hce[0]*nat_death*Is_h)-(hce[1]*death_rate_hosp*Is_h)-(gamma_hosp*Is_h)
-    dRdt = (gamma * (Ia_uk+Ia_k+Is_nh))+(gamma_hosp*Is_h)-(nat_death*R)-(return_rate*R)+(v_freq*v_eff*S)
-    dDdt=nat_death*(S+E+Ia_uk+Ia_k+Is_nh+Is_h+R)+(death_rate_S*Is_nh)+(death_rate_hosp*Is_h)
-    return dSdt, dEdt, dIa_uk_dt, dIa_k_dt, dIs_nh_dt, dIs_h_dt, dRdt, dDdt
-
 # Initial conditions vector
-y0 = S0, E0, Ia_uk0, Ia_k0, Is_nh0, Is_h0, R0, D0
+y0 = np.array([S0, E0, Ia_uk0, Ia_k0, Is_nh0, Is_h0, R0, D0], dtype=float)
 # Integrate the SIR equations over the time grid, t.
-ret = solve_ivp(deriv, t_span=(0,365), y0=y0, t_eval=t, args=(N, vaccination_rate_t0, beta_A_uk, beta_A_k, beta_S_nh, beta_S_h, gamma, gamma_hosp, nat_death, death_rate_S, death_rate_hosp, E_to_I_forA, E_to_I_forS, return_rate, sd, test_rate_inc, t_vac, health_capacity))
-S, E, Ia_uk, Ia_k, Is_nh, Is_h, R, D = ret.y #solving the system of ODEs
+params0 = np.array([N, vaccination_rate_t0, beta_A_uk, beta_A_k, beta_S_nh, beta_S_h, gamma, gamma_hosp, nat_death, death_rate_S, death_rate_hosp, E_to_I_forA, E_to_I_forS, return_rate, sd, test_rate_inc, t_vac, health_capacity, nat_birth, v_eff, hosp], dtype=float)
+Y = integrate(t, y0, params0) #solving the system of ODEs, one row per class
+S, E, Ia_uk, Ia_k, Is_nh, Is_h, R, D = Y
 #Creating a data source for all of class values over time 
-sourcePops=ColumnDataSource(data=dict(time=t, S=S, E=E, Ia_uk=Ia_uk, Ia_k=Ia_k, Is_nh=Is_nh, Is_h=Is_h, R=R, D=D, hc=([health_capacity]*365)))
+sourcePops=ColumnDataSource(data=dict(time=t, S=S, E=E, Ia_uk=Ia_uk, Ia_k=Ia_k, Is_nh=Is_nh, Is_h=Is_h, R=R, D=D, hc=([health_capacity]*t.size)))
 #hover_line=HoverTool(names=["S_line", "E_line"])
 #creating a graph with lines for the different classes of the model
 pops=figure(title="SEIR Model Class Populations", x_axis_label="Time (in days)", y_axis_label="Proportion of people in each class", tools=TOOLS, aspect_ratio=4/3, sizing_mode='scale_both', margin=(10, 20, 10, 40))
@@ -157,6 +142,29 @@ data_for_table=ColumnDataSource(data=dict(names=rate_names, values=rate_values))
 columnsT=[TableColumn(field='names', title="Parameter Name"), TableColumn(field='values', title="Current Value")]
 data_table=DataTable(source=data_for_table, columns=columnsT, margin=(20, 10, 10, 20), width=500, height=800)
 
+#pre-computing the model over a coarse grid of the social distancing, hospital bed and vaccine time sliders (other sliders at their starting values)
+#so that moving one of those sliders to a grid point is a lookup rather than a new integration
+#values between grid points are integrated rather than interpolated: the epidemic peak moves with these parameters, so
+#trilinear interpolation between neighbouring curves had a peak error of about 200-300 of the 1000 people, around the epidemic peak
+sd_grid=np.linspace(0, 1, 11) #social distancing slider values
+beds_grid=np.arange(0, 65, 5) #additional hospital beds slider values
+vac_grid=np.linspace(0, 365, 6) #vaccine introduction time slider values
+params_grid=np.tile(params0, (sd_grid.size*beds_grid.size*vac_grid.size, 1))
+sd_cube, beds_cube, vac_cube=np.meshgrid(sd_grid, beds_grid, vac_grid, indexing='ij')
+params_grid[:, 14]=1-sd_cube.ravel()
+params_grid[:, 17]=health_capacity+beds_cube.ravel()
+params_grid[:, 16]=vac_cube.ravel()
+pops_grid=sweep(t, y0, params_grid)
+
+def solve(params): #returns the model solution for params, from the pre-computed grid when possible
+    match=np.flatnonzero(np.all(np.abs(params_grid-params)<1e-9, axis=1))
+    if match.size:
+        return pops_grid[match[0]]
+    pops=integrate(t, y0, params)
+    if not np.isfinite(pops).all(): #the fixed RK4 step has gone unstable, so use the adaptive stiff solver instead
+        pops=integrate_stiff(t, y0, params)
+    return pops
+
 def update_data(attr, old, new): #when slider values are adjusted this function will be called and then update the data appropriately 
     #retrieving the current value of all of the sliders
     S_infect_rate=S_infection_rate_slide.value
@@ -173,9 +181,9 @@ def update_data(attr, old, new): #when slider values are adjusted this function
     return_rate=return_rate_slide.value
     
     #re-solving the system of ODEs with the new parameter values from the sliders
-    ret = solve_ivp(deriv, t_span=(0,365), y0=y0, t_eval=t, args=(N, vaccination_rate_t, A_infect_rate, A_k_infect, S_infect_rate, beta_S_h, recov_rate, gamma_hosp, nat_death, death_rate, death_rate_hosp, E_to_I_forA, E_to_I_forS, return_rate, sd, test_rate, vaccine, health_cap))
-    S, E, Ia_uk, Ia_k, Is_nh, Is_h, R, D = ret.y
-    sourcePops.data=dict(time=t, S=S, E=E, Ia_uk=Ia_uk, Ia_k=Ia_k, Is_nh=Is_nh, Is_h=Is_h,  R=R, D=D, hc=([health_cap]*365))
+    params = np.array([N, vaccination_rate_t, A_infect_rate, A_k_infect, S_infect_rate, beta_S_h, recov_rate, gamma_hosp, nat_death, death_rate, death_rate_hosp, E_to_I_forA, E_to_I_forS, return_rate, sd, test_rate, vaccine, health_cap, nat_birth, v_eff, hosp], dtype=float)
+    S, E, Ia_uk, Ia_k, Is_nh, Is_h, R, D = solve(params)
+    sourcePops.data=dict(time=t, S=S, E=E, Ia_uk=Ia_uk, Ia_k=Ia_k, Is_nh=Is_nh, Is_h=Is_h,  R=R, D=D, hc=([health_cap]*t.size))
     data_for_table.data=dict(names=rate_names, values=[nat_birth, nat_death, N, A_infect_rate, beta_A_k, S_infect_rate, beta_S_h, return_rate, E_to_I_forA, E_to_I_forS, "0.001*t*"+str(test_rate), hosp, recov_rate, gamma_hosp, death_rate, death_rate_hosp, np.around(vaccination_rate_t, 3), 1-sd])
 
 #this calls the update_data function when slider values are adjusted
@@ -193,7 +201,6 @@ tabB=Panel(child=row(column(pops, infecteds), column(widgets, data_table)), titl
 #NETWORK GRAPH (will be first tab)
 class_names=['Susceptible', 'Exposed', 'Unknown Asymptomatic Infected', 'Known Asymptomatic', 'Non-Hospitalized Symptomatic', 'Hospitalized Infected', 'Recovered', 'Dead']
 needed_edges=[(0, 1), (0, 7), (0, 6), (1, 2), (1,4), (2, 3), (2,6), (2,7), (3, 6), (3,7), (4,5), (4,6), (4,7), (5,6), (5,7), (6,7), (6,0)] #coordinate pairs that represent an edge going from the #x node to the #y node in each pair
-practice_sizes=[5, 10, 15, 20, 25, 30, 35, 40] #temporary numbers just to set up the graph
 
 #Creating the network graph
 G=nx.DiGraph()
@@ -207,12 +214,10 @@ graph_renderer = from_networkx(G, nx.circular_layout, scale=1, center=(0,0))
 
 #creating the nodes/circles for the network graph
 graph_renderer.node_renderer.data_source.add(Colorblind8, 'color')
-graph_renderer.node_renderer.data_source.add(practice_sizes, 'size')
-graph_renderer.node_renderer.glyph = Circle(size='size', fill_color='color')
+graph_renderer.node_renderer.glyph = Circle(size='size', fill_color='color') #the sizes are filled in below, once the model is solved
 graph_renderer.node_renderer.data_source.data['name'] =['Susceptible', 'Exposed', 'Unknown Asymptomatic Infected', 'Known Asymptomatic Infected', 'Non-Hospitalized Symptomatic Infected', 'Hospitalized Symptomatic Infected', 'Recovered', 'Dead']
 graph_renderer.node_renderer.selection_glyph = Circle(size=30, fill_color=Spectral4[2])
 graph_renderer.node_renderer.hover_glyph = Circle(size=30, fill_color=Spectral4[1])
-graph_renderer.node_renderer.data_source
 
 #Creating the edges for the network graph
 graph_renderer.edge_renderer.glyph = MultiLine(line_color="#CCCCCC", line_alpha=0.8, line_width=6)
@@ -232,17 +237,15 @@ labels = LabelSet(x='x',y='y',text='names', text_font_size="13px",
 plot.add_layout(labels)
 plot.renderers.append(graph_renderer)
 
-#solving the system of ODEs with original parameters to determine size of nodes
-ret = solve_ivp(deriv, t_span=(0,365), y0=y0, t_eval=t, args=(N, vaccination_rate_t0, beta_A_uk, beta_A_k, beta_S_nh, beta_S_h, gamma, gamma_hosp, nat_death, death_rate_S, death_rate_hosp, E_to_I_forA, E_to_I_forS, return_rate, sd, test_rate_inc, t_vac, health_capacity))
-Sb, Eb, Ia_ukb, Ia_kb, Is_nhb, Is_hb, Rb, Db = ret.y
-
 #creating slider for the time
 time_slider=Slider(start=0, end=365, value=0, step=1, title="Time (in Days)", width=500, margin=(10, 10, 10, 20))
-start_vals=[Sb[0]/2.3, Eb[0], Ia_ukb[0], Ia_kb[0], Is_nhb[0], Is_hb[0], Rb[0]/2.3, Db[0]]
-current_source=ColumnDataSource(data=dict(sizes=start_vals))
-#updating the node sizes
-graph_renderer.node_renderer.data_source.add(current_source.data['sizes'], 'size')
-graph_renderer.node_renderer.glyph = Circle(size='size', fill_color='color')
+#node sizes and bar heights for every day, so moving the time slider only has to look up a row
+#these use the solution Y for the original parameters from above, with the Susceptible and Recovered circles at half size
+SIZES=(Y.T/[2.3, 1, 1, 1, 1, 1, 2.3, 1]).astype(np.float32)
+PROPORTIONS=(Y.T/1000).astype(np.float32)
+#updating the node sizes, the node glyph is already bound to the 'size' column so only that column needs to change
+node_source=graph_renderer.node_renderer.data_source
+node_source.data['size']=SIZES[0].tolist()
 
 #when edge is hovered over, will display a description of the movement of individuals along that edge
 hover_tool = HoverTool(tooltips=[("Path Movement", "@edge_names")])
@@ -250,8 +253,7 @@ plot.add_tools(hover_tool, TapTool(), BoxSelectTool(), ResetTool())
 
 
 ####### Bar Graph
-proportion_pops=[Sb[0]/1000, Eb[0]/1000, Ia_ukb[0]/1000, Ia_kb[0]/1000, Is_nhb[0]/1000, Is_hb[0]/1000, Rb[0]/1000, Db[0]/1000]
-bar_source=ColumnDataSource(data=dict(tall=proportion_pops, names=class_names, colors=Colorblind8))
+bar_source=ColumnDataSource(data=dict(tall=PROPORTIONS[0].tolist(), names=class_names, colors=Colorblind8))
 bargraph=figure(x_range=class_names, y_range=Range1d(0, 1.04), title="Proportion of Population in Each Class", tools=("reset, box_zoom"), height=600, margin=(15, 10, 10, 10))
 bargraph.vbar(x='names', top='tall', color='colors', source=bar_source, width=0.5)
 bargraph.title.text_font_size='14pt'
@@ -259,47 +261,31 @@ bargraph.xaxis.major_label_orientation=45
 bar_hover=HoverTool(tooltips=[("Current Proportion", "@tall")])
 bargraph.add_tools(bar_hover)
 
-
-def update_data_bubble(attr, old, new): #when time slider value changes the graphs update to show class sizes at that specific time
-    t=time_slider.value #current time
-    #retrieving class values for time t
-    newS=Sb[t]
-    newE=Eb[t]
-    newI1=Ia_ukb[t]
-    newI2=Ia_kb[t]
-    newI3=Is_nhb[t]
-    newI4=Is_hb[t]
-    newR=Rb[t]
-    newD=Db[t]
-    new_dict=[newS/2.3, newE, newI1, newI2, newI3, newI4, newR/2.3, newD]
-    new_bar=[newS/1000, newE/1000, newI1/1000, newI2/1000, newI3/1000, newI4/1000, newR/1000, newD/1000]
-    #updating graph values
-    current_source.data=dict(sizes=new_dict)
-    bar_source.data=dict(tall=new_bar, names=class_names, colors=Colorblind8)
-    graph_renderer.node_renderer.data_source.add(current_source.data['sizes'], 'size')
-    graph_renderer.node_renderer.glyph = Circle(size='size', fill_color='color')
-    
-def animate_update(): #this function animates the graph by continually increasing the time point being looked at 
-    day = time_slider.value
-    if day <= 365:
-        new_dict=[Sb[day]/2.3, Eb[day], Ia_ukb[day], Ia_kb[day], Is_nhb[day], Is_hb[day], Rb[day]/2.3, Db[day]]
-        new_bar=[Sb[day]/1000, Eb[day]/1000, Ia_ukb[day]/1000, Ia_kb[day]/1000, Is_nhb[day]/1000, Is_hb[day]/1000, Rb[day]/1000, Db[day]/1000]
-        current_source.data=dict(sizes=new_dict)
-        bar_source.data=dict(tall=new_bar, names=class_names, colors=Colorblind8)
-        graph_renderer.node_renderer.data_source.add(current_source.data['sizes'], 'size')
-        graph_renderer.node_renderer.glyph = Circle(size='size', fill_color='color')
-        time_slider.value = day+1 #progress to next time unit
-        
-
-callback_id = None
-def animate(): #this function calls the animate_update() function to animate when the button is pressed
-    global callback_id
-    if button.label == '► Play':
+#the sizes and proportions for every day are sent to the browser once, one row of 8 values per day, so the time slider
+#and the animation run in the browser without a round trip to the server
+day_source=ColumnDataSource(data=dict(sizes=SIZES.ravel(), proportions=PROPORTIONS.ravel()))
+#when time slider value changes the graphs update to show class sizes at that specific time
+update_data_bubble=CustomJS(args=dict(days=day_source, node_source=node_source, bar_source=bar_source, slider=time_slider), code="""
+    const t = slider.value*8
+    node_source.data['size'] = Array.from(days.data['sizes'].slice(t, t+8))
+    bar_source.data['tall'] = Array.from(days.data['proportions'].slice(t, t+8))
+    node_source.change.emit()
+    bar_source.change.emit()
+""")
+#animates the graph by moving the time slider on a day every 100ms while playing, update_data_bubble then redraws the graphs
+animate=CustomJS(args=dict(slider=time_slider), code="""
+    const button = cb_obj
+    if (button.label == '► Play') {
         button.label = '❚❚ Pause'
-        callback_id = curdoc().add_periodic_callback(animate_update, 100)
-    else:
+        button.timer = setInterval(function() {
+            if (slider.value < slider.end)
+                slider.value = slider.value+1
+        }, 100)
+    } else {
         button.label = '► Play'
-        curdoc().remove_periodic_callback(callback_id)
+        clearInterval(button.timer)
+    }
+""")
 
 #adding arrows to edges to make it a directed graph
 start_coord=[[.95, .117], [.97, -.07], [.9, -.1],[.64, .7257], [.625, .6691], [-.15, .9357], [0, .9], [.05, .878], [-.65, .5785], [-.65, .65], [-.94, -.14], [-.9, -.1], [-.85, -.0618], [-.6, -.7], [-.6, -.743], [.1, -.957], [.1, -.9]]
@@ -308,9 +294,9 @@ for i in range(0, 17):
     plot.add_layout(Arrow(end=OpenHead(line_color="black", line_width=2, size=10, line_alpha=.65), x_start=start_coord[i][0], y_start=start_coord[i][1], x_end=end_coord[i][0], y_end=end_coord[i][1], line_alpha=0.25))
 
 #function called when button is pressed    
-time_slider.on_change('value', update_data_bubble)
+time_slider.js_on_change('value', update_data_bubble)
 button = Button(label='► Play', width=120, margin=(1, 1, 1, 20))
-button.on_click(animate)
+button.js_on_click(animate)
 
 #adding descriptive info
 note1=Div(text="Note that the size of all circles are proportional to their population size, except for the Susceptible and Recovered classes, which are shown at half capacity for ease of visualization", width=600, margin=(20, 1, 5, 20))
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Compiled kernels for the SEIR model in SIR.py.
+
+Importing this module gives numba JIT versions of deriv and integrate, which are cached on disk
+after the first compile. Running it as a script compiles integrate ahead of time into the
+seir_aot_ext extension module, so the Bokeh server only has to load a shared library at start up:
+    python seir_aot.py
+SIR.py uses seir_aot_ext for single trajectories when it has been built, but still imports this module for the
+parallel parameter sweep (integrate_batch and sweep) and the stiff solver, so numba remains a requirement and those
+kernels are always JIT compiled; pycc cannot build parallel code. numba.pycc itself is pending deprecation.
+
+params is a float array holding, in order:
+    N, vaccination_rate, beta_A_uk, beta_A_k, beta_S_nh, beta_S_h, gamma, gamma_hosp, nat_death,
+    death_rate_S, death_rate_hosp, E_to_I_forA, E_to_I_forS, return_rate, sd, test_rate_inc, t_vac,
+    health_capacity, nat_birth, v_eff, hosp
+"""
+import math
+import numpy as np
+from scipy.integrate import odeint
+from numba import njit, prange
+
+# The SIR model differential equations.
+# vac_freq and health_cap_effect are written inline: the vaccine rate ramps up around t_vac, and once the hospitalized
+# class passes the health capacity the death rate rises by up to 50% and the recovery rate drops by up to 30%
+@njit(fastmath=True, cache=True)
+def deriv(t, y, params):
+    S, E, Ia_uk, Ia_k, Is_nh, Is_h, R, D = y
+    N, vaccination_rate, beta_A_uk, beta_A_k, beta_S_nh, beta_S_h, gamma, gamma_hosp, nat_death, death_rate_S, death_rate_hosp, E_to_I_forA, E_to_I_forS, return_rate, sd, test_rate_inc, t_vac, health_capacity, nat_birth, v_eff, hosp = params
+    v_freq=vaccination_rate*(math.atan(t-t_vac)+(math.pi/2))
+    test_rate=.001*t*test_rate_inc
+    diff=(health_capacity-Is_h)
+    hcd=1+(0.5/(1+math.exp(diff)))
+    hcr=0.7+(0.3/(1+math.exp(-diff)))
+    inv_N=1.0/N
+    foi=(beta_S_nh*sd*Is_nh + beta_S_h*Is_h + beta_A_uk*sd*Ia_uk + beta_A_k*sd*Ia_k)*inv_N*S #force of infection on the susceptibles
+    #below are the 8 ODEs for each of the 8 classes
+    dy=np.empty(8)
+    dy[0] = -foi-(nat_death*S)+(nat_birth*(N-D))+(return_rate*R)-(v_freq*v_eff*S)
+    dy[1] = foi-(E_to_I_forA+E_to_I_forS+nat_death)*E #all three ways of leaving the exposed class share the factor E
+    dy[2] = (E_to_I_forA*E)-(nat_death*Ia_uk)-(gamma*Ia_uk)-(test_rate*Ia_uk)
+    dy[3] = (test_rate*Ia_uk)-(nat_death*Ia_k)-(gamma*Ia_k)
+    dy[4] = (E_to_I_forS*E)-(nat_death*Is_nh)-(death_rate_S*Is_nh)-(gamma*Is_nh)-(hosp*Is_nh)
+    dy[5] = (hosp*Is_nh)-(hcd*nat_death*Is_h)-(hcr*death_rate_hosp*Is_h)-(gamma_hosp*Is_h)
+    dy[6] = (gamma * (Ia_uk+Ia_k+Is_nh))+(gamma_hosp*Is_h)-(nat_death*R)-(return_rate*R)+(v_freq*v_eff*S)
+    dy[7] = nat_death*(S+E+Ia_uk+Ia_k+Is_nh+Is_h+R)+(death_rate_S*Is_nh)+(death_rate_hosp*Is_h)
+    return dy
+
+# The linear part of the model as an 8x8 matrix of transfer rates between classes, which only depends on params.
+# It is built once per parameter set; jac adds the entries that change with time and with the class sizes
+@njit(fastmath=True, cache=True)
+def transfer_rates(params):
+    N, vaccination_rate, beta_A_uk, beta_A_k, beta_S_nh, beta_S_h, gamma, gamma_hosp, nat_death, death_rate_S, death_rate_hosp, E_to_I_forA, E_to_I_forS, return_rate, sd, test_rate_inc, t_vac, health_capacity, nat_birth, v_eff, hosp = params
+    A=np.zeros((8, 8))
+    A[0, 0]=-nat_death
+    A[0, 6]=return_rate
+    A[0, 7]=-nat_birth
+    A[1, 1]=-E_to_I_forA-E_to_I_forS-nat_death
+    A[2, 1]=E_to_I_forA
+    A[2, 2]=-nat_death-gamma
+    A[3, 3]=-nat_death-gamma
+    A[4, 1]=E_to_I_forS
+    A[4, 4]=-nat_death-death_rate_S-gamma-hosp
+    A[5, 4]=hosp
+    A[5, 5]=-gamma_hosp
+    A[6, 2:5]=gamma
+    A[6, 5]=gamma_hosp
+    A[6, 6]=-nat_death-return_rate
+    A[7, :7]=nat_death
+    A[7, 4]+=death_rate_S
+    A[7, 5]+=death_rate_hosp
+    return A
+
+# Analytic Jacobian of deriv with respect to y, for the stiff solver below. A is transfer_rates(params)
+@njit(fastmath=True, cache=True)
+def jac(t, y, params, A):
+    S, E, Ia_uk, Ia_k, Is_nh, Is_h, R, D = y
+    N, vaccination_rate, beta_A_uk, beta_A_k, beta_S_nh, beta_S_h, gamma, gamma_hosp, nat_death, death_rate_S, death_rate_hosp, E_to_I_forA, E_to_I_forS, return_rate, sd, test_rate_inc, t_vac, health_capacity, nat_birth, v_eff, hosp = params
+    v_freq=vaccination_rate*(math.atan(t-t_vac)+(math.pi/2))
+    test_rate=.001*t*test_rate_inc
+    diff=(health_capacity-Is_h)
+    hcd=1+(0.5/(1+math.exp(diff)))
+    hcr=0.7+(0.3/(1+math.exp(-diff)))
+    slope=1/((1+math.exp(diff))*(1+math.exp(-diff))) #derivative of the logistic terms in hcd and hcr
+    inv_N=1.0/N
+    infect=(beta_S_nh*sd*Is_nh + beta_S_h*Is_h + beta_A_uk*sd*Ia_uk + beta_A_k*sd*Ia_k)*inv_N
+    J=A.copy()
+    #force of infection, moving people from S to E
+    J[0, 0]-=infect+(v_freq*v_eff)
+    J[1, 0]=infect
+    J[0, 2]=-beta_A_uk*sd*S*inv_N
+    J[0, 3]=-beta_A_k*sd*S*inv_N
+    J[0, 4]=-beta_S_nh*sd*S*inv_N
+    J[0, 5]=-beta_S_h*S*inv_N
+    J[1, 2:6]=-J[0, 2:6]
+    #testing and vaccination, which both grow with time
+    J[2, 2]-=test_rate
+    J[3, 2]=test_rate
+    J[6, 0]=v_freq*v_eff
+    #hospital capacity effects
+    J[5, 5]-=(hcd*nat_death)+(hcr*death_rate_hosp)+Is_h*slope*((0.5*nat_death)-(0.3*death_rate_hosp))
+    return J
+
+# Classic fixed-step RK4 over the time grid, taking rk4_substeps steps between consecutive output times
+rk4_substeps=4
+@njit(fastmath=True, cache=True)
+def integrate(t, y0, params):
+    out=np.empty((8, t.size))
+    y=y0.copy()
+    out[:, 0]=y
+    for i in range(t.size-1):
+        h=(t[i+1]-t[i])/rk4_substeps
+        for j in range(rk4_substeps):
+            tj=t[i]+j*h
+            k1=deriv(tj, y, params)
+            k2=deriv(tj+h/2, y+(h/2)*k1, params)
+            k3=deriv(tj+h/2, y+(h/2)*k2, params)
+            k4=deriv(tj+h, y+h*k3, params)
+            y=y+(h/6)*(k1+2*k2+2*k3+k4)
+        out[:, i+1]=y
+    return out
+
+# Adaptive LSODA with the analytic Jacobian, for parameters that make the fixed RK4 step unstable.
+# odeint runs the LSODA stepper in Fortran, which avoids solve_ivp's per step Python overhead on a system this small
+def integrate_stiff(t, y0, params):
+    A=transfer_rates(params)
+    return odeint(lambda y, t: deriv(t, y, params), y0, t, Dfun=lambda y, t: jac(t, y, params, A)).T
+
+# Integrates one trajectory per row of params (shape (K, number of parameters)) in parallel, returning shape (K, 8, len(t))
+@njit(parallel=True, cache=True)
+def integrate_batch(t, y0, params):
+    out=np.empty((params.shape[0], 8, t.size))
+    for k in prange(params.shape[0]):
+        out[k]=integrate(t, y0, params[k])
+    return out
+
+# Bokeh runs SIR.py once per session, so parameter sweeps are kept here where they are shared by every session in the process
+sweeps={}
+def sweep(t, y0, params):
+    key=(t.tobytes(), y0.tobytes(), params.tobytes())
+    if key not in sweeps:
+        sweeps[key]=integrate_batch(t, y0, params)
+    return sweeps[key]
+
+
+if __name__ == "__main__":
+    from numba.pycc import CC
+    import os
+
+    cc = CC('seir_aot_ext')
+    cc.output_dir = os.path.dirname(os.path.abspath(__file__))
+    cc.export('integrate', 'f8[:,:](f8[:], f8[:], f8[:])')(integrate.py_func)
+    cc.compile()
@@ -0,0 +1,102 @@
+# cython: language_level=3, boundscheck=False, wraparound=False, cdivision=True
+# distutils: extra_compile_args = -O3 -ffast-math
+"""
+Cython build of the SEIR kernels in seir_aot.py, for deployments where numba is not installed.
+
+The model equations are plain C functions that run without the GIL, so the RK4 loop in integrate never
+goes back into Python between steps. deriv, integrate, integrate_stiff and sweep take the same arguments
+and return the same arrays as the numba versions. To build the extension in place run:
+    cythonize -i -a seir_deriv.pyx
+The -O3 -ffast-math compile flags are set in the distutils line above. They only apply to compiling, so the
+shared library does not switch the whole process into flush-to-zero mode the way linking with -ffast-math does.
+params is laid out as described in seir_aot.py.
+"""
+import numpy as np
+from scipy.integrate import odeint
+from libc.math cimport atan, exp, M_PI
+
+# The vaccine rate ramps up around t_vac
+cdef inline double _vac_freq(double t, double t_vac) noexcept nogil:
+    return atan(t-t_vac)+(M_PI/2)
+
+# The SIR model differential equations, writing the 8 derivatives of y into out
+cdef void _deriv(double t, const double *y, const double *p, double *out) noexcept nogil:
+    cdef double S=y[0], E=y[1], Ia_uk=y[2], Ia_k=y[3], Is_nh=y[4], Is_h=y[5], R=y[6], D=y[7]
+    cdef double N=p[0], vaccination_rate=p[1], beta_A_uk=p[2], beta_A_k=p[3], beta_S_nh=p[4], beta_S_h=p[5], gamma=p[6]
+    cdef double gamma_hosp=p[7], nat_death=p[8], death_rate_S=p[9], death_rate_hosp=p[10], E_to_I_forA=p[11], E_to_I_forS=p[12]
+    cdef double return_rate=p[13], sd=p[14], test_rate_inc=p[15], t_vac=p[16], health_capacity=p[17], nat_birth=p[18], v_eff=p[19], hosp=p[20]
+    cdef double v_freq=vaccination_rate*_vac_freq(t, t_vac)
+    cdef double test_rate=.001*t*test_rate_inc
+    cdef double diff=(health_capacity-Is_h)
+    cdef double hcd=1+(0.5/(1+exp(diff)))
+    cdef double hcr=0.7+(0.3/(1+exp(-diff)))
+    cdef double foi=(beta_S_nh*sd*Is_nh + beta_S_h*Is_h + beta_A_uk*sd*Ia_uk + beta_A_k*sd*Ia_k)*S/N #force of infection on the susceptibles
+    out[0] = -foi-(nat_death*S)+(nat_birth*(N-D))+(return_rate*R)-(v_freq*v_eff*S)
+    out[1] = foi-(E_to_I_forA+E_to_I_forS+nat_death)*E #all three ways of leaving the exposed class share the factor E
+    out[2] = (E_to_I_forA*E)-(nat_death*Ia_uk)-(gamma*Ia_uk)-(test_rate*Ia_uk)
+    out[3] = (test_rate*Ia_uk)-(nat_death*Ia_k)-(gamma*Ia_k)
+    out[4] = (E_to_I_forS*E)-(nat_death*Is_nh)-(death_rate_S*Is_nh)-(gamma*Is_nh)-(hosp*Is_nh)
+    out[5] = (hosp*Is_nh)-(hcd*nat_death*Is_h)-(hcr*death_rate_hosp*Is_h)-(gamma_hosp*Is_h)
+    out[6] = (gamma * (Ia_uk+Ia_k+Is_nh))+(gamma_hosp*Is_h)-(nat_death*R)-(return_rate*R)+(v_freq*v_eff*S)
+    out[7] = nat_death*(S+E+Ia_uk+Ia_k+Is_nh+Is_h+R)+(death_rate_S*Is_nh)+(death_rate_hosp*Is_h)
+
+def deriv(double t, y, params):
+    cdef double[::1] yv=np.ascontiguousarray(y, dtype=np.float64)
+    cdef double[::1] pv=np.ascontiguousarray(params, dtype=np.float64)
+    dy=np.empty(8)
+    cdef double[::1] out=dy
+    _deriv(t, &yv[0], &pv[0], &out[0])
+    return dy
+
+# Classic fixed-step RK4 over the time grid, taking rk4_substeps steps between consecutive output times
+rk4_substeps=4
+def integrate(t, y0, params):
+    cdef double[::1] tv=np.ascontiguousarray(t, dtype=np.float64)
+    cdef double[::1] pv=np.ascontiguousarray(params, dtype=np.float64)
+    result=np.empty((t.size, 8))
+    cdef double[:, ::1] out=result
+    cdef double y[8]
+    cdef double tmp[8]
+    cdef double k1[8]
+    cdef double k2[8]
+    cdef double k3[8]
+    cdef double k4[8]
+    cdef int substeps=rk4_substeps
+    cdef Py_ssize_t i, j, m
+    cdef double h, tj
+    for m in range(8):
+        y[m]=y0[m]
+        out[0, m]=y[m]
+    with nogil:
+        for i in range(tv.shape[0]-1):
+            h=(tv[i+1]-tv[i])/substeps
+            for j in range(substeps):
+                tj=tv[i]+j*h
+                _deriv(tj, y, &pv[0], k1)
+                for m in range(8):
+                    tmp[m]=y[m]+(h/2)*k1[m]
+                _deriv(tj+h/2, tmp, &pv[0], k2)
+                for m in range(8):
+                    tmp[m]=y[m]+(h/2)*k2[m]
+                _deriv(tj+h/2, tmp, &pv[0], k3)
+                for m in range(8):
+                    tmp[m]=y[m]+h*k3[m]
+                _deriv(tj+h, tmp, &pv[0], k4)
+                for m in range(8):
+                    y[m]+=(h/6)*(k1[m]+2*k2[m]+2*k3[m]+k4[m])
+            for m in range(8):
+                out[i+1, m]=y[m]
+    return result.T
+
+# Adaptive LSODA, for parameters that make the fixed RK4 step unstable
+def integrate_stiff(t, y0, params):
+    params=np.ascontiguousarray(params, dtype=np.float64)
+    return odeint(lambda y, t: deriv(t, y, params), y0, t).T
+
+# Without numba the parameter sweep runs one trajectory at a time, kept per process like the numba version
+sweeps={}
+def sweep(t, y0, params):
+    key=(t.tobytes(), y0.tobytes(), params.tobytes())
+    if key not in sweeps:
+        sweeps[key]=np.stack([integrate(t, y0, p) for p in params])
+    return sweeps[key]
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SEIR integrator using Julia's DifferentialEquations through diffeqpy, for deployments that have Julia installed.
+
+The model equations are written in Julia below, so the whole Tsit5 solve runs in compiled Julia code and never
+calls back into Python. Julia compiles seir! and seir_solve the first time they are used, which happens here at
+import. On first use diffeqpy may also download and install Julia and its packages, which can take minutes, so
+SIR.py only imports this module when the SEIR_USE_JULIA environment variable is set to 1. If the import fails for
+any reason SIR.py keeps the numba or Cython kernels.
+params is laid out as described in seir_aot.py.
+"""
+import numpy as np
+from diffeqpy import ode
+
+# The SIR model differential equations, the same as deriv in seir_aot.py
+ode.seval("""
+function seir!(dy, y, p, t)
+    S, E, Ia_uk, Ia_k, Is_nh, Is_h, R, D = y
+    N, vaccination_rate, beta_A_uk, beta_A_k, beta_S_nh, beta_S_h, gamma, gamma_hosp, nat_death, death_rate_S, death_rate_hosp, E_to_I_forA, E_to_I_forS, return_rate, sd, test_rate_inc, t_vac, health_capacity, nat_birth, v_eff, hosp = p
+    v_freq=vaccination_rate*(atan(t-t_vac)+(pi/2))
+    test_rate=.001*t*test_rate_inc
+    diff=(health_capacity-Is_h)
+    hcd=1+(0.5/(1+exp(diff)))
+    hcr=0.7+(0.3/(1+exp(-diff)))
+    foi=(beta_S_nh*sd*Is_nh + beta_S_h*Is_h + beta_A_uk*sd*Ia_uk + beta_A_k*sd*Ia_k)*S/N
+    dy[1] = -foi-(nat_death*S)+(nat_birth*(N-D))+(return_rate*R)-(v_freq*v_eff*S)
+    dy[2] = foi-(E_to_I_forA+E_to_I_forS+nat_death)*E #all three ways of leaving the exposed class share the factor E
+    dy[3] = (E_to_I_forA*E)-(nat_death*Ia_uk)-(gamma*Ia_uk)-(test_rate*Ia_uk)
+    dy[4] = (test_rate*Ia_uk)-(nat_death*Ia_k)-(gamma*Ia_k)
+    dy[5] = (E_to_I_forS*E)-(nat_death*Is_nh)-(death_rate_S*Is_nh)-(gamma*Is_nh)-(hosp*Is_nh)
+    dy[6] = (hosp*Is_nh)-(hcd*nat_death*Is_h)-(hcr*death_rate_hosp*Is_h)-(gamma_hosp*Is_h)
+    dy[7] = (gamma * (Ia_uk+Ia_k+Is_nh))+(gamma_hosp*Is_h)-(nat_death*R)-(return_rate*R)+(v_freq*v_eff*S)
+    dy[8] = nat_death*(S+E+Ia_uk+Ia_k+Is_nh+Is_h+R)+(death_rate_S*Is_nh)+(death_rate_hosp*Is_h)
+    nothing
+end
+""")
+# Solves over the time grid t and returns an 8 x len(t) matrix, like integrate in seir_aot.py
+seir_solve=ode.seval("""
+function seir_solve(t, y0, p)
+    prob=ODEProblem(seir!, Vector{Float64}(y0), (t[1], t[end]), Vector{Float64}(p))
+    Array(solve(prob, Tsit5(), saveat=Vector{Float64}(t), reltol=1e-8, abstol=1e-6))
+end
+""")
+
+def integrate(t, y0, params):
+    return np.asarray(seir_solve(t, y0, params))
+
+integrate(np.linspace(0, 1, 2), np.ones(8), np.ones(21)) #compile the Julia code now, rather than in the first session
+
+# The pre-computed parameter grid in SIR.py is solved with Julia too, so grid points and the values in between come
+# from the same solver. Like the numba version, sweeps are kept per process and shared by every session
+sweeps={}
+def sweep(t, y0, params):
+    key=(t.tobytes(), y0.tobytes(), params.tobytes())
+    if key not in sweeps:
+        sweeps[key]=np.stack([integrate(t, y0, p) for p in params])
+    return sweeps[key]
@@ -0,0 +1,32 @@
+''' Pre-compute the correlation matrix shown in the Correlation Matrix tab of
+catalysis_data_interactive_visualization.py, so the Bokeh server reads it
+from data/OCM-correlation.csv instead of computing it for every session.
+Run this again whenever data/OCM-data.csv changes:
+    python build_correlation_matrix.py
+'''
+import os
+import pandas as pd
+
+data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+# Import dataset
+df_catalysis_dataset = pd.read_csv(os.path.join(data_dir, "OCM-data.csv"),
+                                   index_col=0, header=0)
+
+# Removing the Blank names from the data, as the visualization does
+df_catalysis_dataset = df_catalysis_dataset.drop(index="Blank", errors="ignore")
+
+# Copy x-axis values into new df
+df_corr = df_catalysis_dataset[
+    ["CT", "Ar_flow", "CH4_flow", "O2_flow", "Total_flow", "Support_ID", "Temp",
+     "M2_mol", "M3_mol", "M1_atom_number", "M2_atom_number", "M3_atom_number",
+     "M1_mol_percentage", "M2_mol_percentage", "M3_mol_percentage"]
+]
+corr_matrix = df_corr.corr()
+
+# One row per pair of parameters, as used by the heatmap
+df_corr = pd.DataFrame(corr_matrix)
+df_corr = df_corr.set_index(df_corr.columns).rename_axis('parameters', axis=1)
+df_corr.index.name = 'level_0'
+df_corr = pd.DataFrame(df_corr.stack(), columns=['correlation']).reset_index()
+df_corr.to_csv(os.path.join(data_dir, "OCM-correlation.csv"), index=False)
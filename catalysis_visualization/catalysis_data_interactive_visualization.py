@@ -1,10 +1,12 @@
 from enum import auto
+from functools import lru_cache
+import json
 from bokeh.models.widgets.markups import Div
 import numpy as np
 import pandas as pd
 from bokeh.io import curdoc
 from bokeh.layouts import column, row, gridplot
-from bokeh.models import ColumnDataSource, Select, Slider, BoxSelectTool, LassoSelectTool, Tabs, Panel, LinearColorMapper, CategoricalColorMapper, ColorBar, BasicTicker, PrintfTickFormatter, MultiSelect, DataTable, TableColumn
+from bokeh.models import ColumnDataSource, Select, Slider, BoxSelectTool, LassoSelectTool, Tabs, Panel, LinearColorMapper, CategoricalColorMapper, ColorBar, BasicTicker, PrintfTickFormatter, MultiSelect, DataTable, TableColumn, CustomJSHover
 from bokeh.plotting import figure, curdoc
 from bokeh.palettes import viridis, gray, cividis, Category20
 from bokeh.transform import factor_cmap
@@ -22,8 +24,7 @@ df_catalysis_dataset = pd.read_csv("catalysis_visualization/data/OCM-data.csv",
                                    index_col=0, header=0)
 
 # Removing the Blank names from the data
-df_catalysis_dataset.set_index(df_catalysis_dataset.index)
-df_catalysis_dataset.drop("Blank", axis=0)
+df_catalysis_dataset = df_catalysis_dataset.drop(index="Blank", errors="ignore")
 
 # Calculating error percentage
 
@@ -88,11 +89,29 @@ select_y_axis = Select(title="Y Axis",
                        options=sorted(axis_map_y.keys()),
                        value="CarbonDiOxide_y")
 
+# Columns shown in the Data Exploration plot, kept as plain arrays: float32 for
+# the axes and integer category codes for the labels, which are sent to the
+# browser as compact binary arrays and decoded there by the hover tool
+exploration_columns = {
+    name: df_catalysis_dataset[name].to_numpy(dtype=np.float32)
+    for name in list(axis_map_x.values()) + list(axis_map_y.values())
+}
+label_codes = {}
+label_formatters = {}
+for name, labels in [("M1", df_catalysis_dataset["M1"]),
+                     ("M2", df_catalysis_dataset["M2"]),
+                     ("M3", df_catalysis_dataset["M3"]),
+                     ("Name", df_catalysis_dataset.index)]:
+    categories = pd.Categorical(labels)
+    label_codes[name] = categories.codes
+    label_formatters["@" + name] = CustomJSHover(
+        code="return %s[value]" % json.dumps(list(categories.categories)))
+
 TOOLTIPS = [
-    ("M1", "@M1"),
-    ("M2", "@M2"),
-    ("M3", "@M3"),
-    ("Catalyst/Support", "@Name")
+    ("M1", "@M1{custom}"),
+    ("M2", "@M2{custom}"),
+    ("M3", "@M3{custom}"),
+    ("Catalyst/Support", "@Name{custom}")
 ]
 
 # tools in the toolbar
@@ -103,6 +122,7 @@ source = ColumnDataSource(data=dict(x=[], y=[], M1=[], M2=[], M3=[], Name=[]))
 
 p = figure(height=600, width=700, title="Data Exploration", tools=TOOLS,
            toolbar_location="above", tooltips=TOOLTIPS)
+p.hover.formatters = label_formatters
 p.select(BoxSelectTool).select_every_mousemove = False
 p.select(LassoSelectTool).select_every_mousemove = False
 r = p.circle(x="x", y="y", source=source, size=7,
@@ -110,17 +130,60 @@ r = p.circle(x="x", y="y", source=source, size=7,
 # r = p.scatter(x = "x",y="y",alpha=0.3)
 
 
+# Pre-sorting the filtered columns once, so that each threshold filter is a
+# binary search instead of a comparison against every row
+def sort_column(values):
+    values = np.asarray(values, dtype=np.float64)
+    order = np.argsort(values, kind="stable")  # NaNs are sorted to the end
+    n_valid = np.count_nonzero(~np.isnan(values))
+    # rank[i] is the position of row i in the sorted order
+    rank = np.empty(len(values), dtype=np.intp)
+    rank[order] = np.arange(len(values))
+    return values[order][:n_valid], rank
+
+
+def rows_at_least(column, rows, threshold):
+    sorted_values, rank = column
+    rank = rank[rows]
+    return (rank >= np.searchsorted(sorted_values, threshold, side="left")) & (rank < len(sorted_values))
+
+
+def rows_at_most(column, rows, threshold):
+    sorted_values, rank = column
+    return rank[rows] < np.searchsorted(sorted_values, threshold, side="right")
+
+
+sorted_ch4_conv = sort_column(df_catalysis_dataset.CH4_conv)
+sorted_C2y = sort_column(df_catalysis_dataset.C2y)
+sorted_temp = sort_column(df_catalysis_dataset.Temp)
+sorted_error = sort_column(df_catalysis_dataset.error_ch4_conv)
+# row positions for each CH4 to O2 ratio
+rows_by_ch4_to_o2 = {float(ratio): rows for ratio, rows in
+                     df_catalysis_dataset.groupby("CH4/O2").indices.items()}
+
+
+# Row positions of the data points passing the filters, cached so that the
+# scatter plot and both histograms share a single filtering pass
+@lru_cache(maxsize=8)
+def select_indices(methane_conversion, C2y, temp, error, ch4_to_o2):
+    rows = rows_by_ch4_to_o2.get(float(ch4_to_o2), np.array([], dtype=np.intp))
+    selected = (
+        rows_at_least(sorted_ch4_conv, rows, methane_conversion) &
+        rows_at_least(sorted_C2y, rows, C2y) &
+        rows_at_least(sorted_temp, rows, float(temp)) &
+        rows_at_most(sorted_error, rows, float(error))
+    )
+    return rows[selected]
+
+
+def current_indices():
+    return select_indices(slider_methane_conversion.value, slider_C2y.value,
+                          slider_temp.value, slider_error.value,
+                          select_ch4_to_o2.value)
+
+
 def select_data():
-    temp_val = slider_temp.value
-    select_ch4_to_o2_val = select_ch4_to_o2.value
-    selected = df_catalysis_dataset[
-        (df_catalysis_dataset.CH4_conv >= slider_methane_conversion.value) &
-        (df_catalysis_dataset.C2y >= slider_C2y.value) &
-        (df_catalysis_dataset.Temp >= float(slider_temp.value)) &
-        (df_catalysis_dataset.error_ch4_conv <= float(slider_error.value)) &
-        (df_catalysis_dataset['CH4/O2'] == float(select_ch4_to_o2.value))
-    ]
-    return selected
+    return df_catalysis_dataset.iloc[current_indices()]
 
 
 # the horizontal histogram
@@ -168,34 +231,45 @@ vh2 = pv.quad(
 layout = gridplot([[p, pv], [ph, None]], merge_tools=True)
 
 
+# Histogram bin of each value, matching np.histogram: bins are half-open
+# except the last one, which also includes the right edge
+def bin_positions(values, edges):
+    return np.clip(np.searchsorted(edges, values, side="right") - 1, 0, len(edges) - 2)
+
+
 # Brought in update for the histogram selections attempt
 def update():
-    df = select_data()
-    x_name = axis_map_x[select_x_axis.value]
-    y_name = axis_map_y[select_y_axis.value]
+    selected = current_indices()
+    x_sel = exploration_columns[axis_map_x[select_x_axis.value]][selected]
+    y_sel = exploration_columns[axis_map_y[select_y_axis.value]][selected]
     p.xaxis.axis_label = select_x_axis.value
     p.yaxis.axis_label = select_y_axis.value
     source.data = dict(
-        x=df[x_name],
-        y=df[y_name],
-        M1=df['M1'],
-        M2=df['M2'],
-        M3=df['M3'],
-        Name=df.index
+        x=x_sel,
+        y=y_sel,
+        M1=label_codes['M1'][selected],
+        M2=label_codes['M2'][selected],
+        M3=label_codes['M3'][selected],
+        Name=label_codes['Name'][selected]
     )
 
     # also update both histograms
-    global hhist, hedges, vhist, vedges
-    if len(df) == 0:
+    # the bin of every plotted point is kept so that update_histogram can
+    # count a selection without binning the data again
+    global hhist, hedges, vhist, vedges, hbins, vbins
+    if len(selected) == 0:
         hhist, hedges = hzeros, hzeros
         vedges, vhist = vzeros, vzeros
+        hbins, vbins = selected, selected
         hh.data_source.data["top"] = hzeros
         vv.data_source.data["right"] = vzeros
     else:
-        hhist, hedges = np.histogram(
-            df[axis_map_x[select_x_axis.value]], bins=10)
-        vhist, vedges = np.histogram(
-            df[axis_map_y[select_y_axis.value]], bins=10)
+        hedges = np.histogram_bin_edges(x_sel, bins=10)
+        vedges = np.histogram_bin_edges(y_sel, bins=10)
+        hbins = bin_positions(x_sel, hedges)
+        vbins = bin_positions(y_sel, vedges)
+        hhist = np.bincount(hbins, minlength=10)
+        vhist = np.bincount(vbins, minlength=10)
         ph.y_range.end = max(hhist)*1.1
         pv.x_range.end = max(vhist)*1.1
         hh.data_source.data["top"] = hhist
@@ -224,21 +298,12 @@ inputs = column(*controls, width=320)
 
 def update_histogram(attr, old, new):
     inds = new
-    if len(inds) == 0 or len(inds) == len(select_data()[axis_map_x[select_x_axis.value]]):
+    if len(inds) == 0 or len(inds) == len(hbins):
         hhist1, hhist2 = hzeros, hzeros
         vhist1, vhist2 = vzeros, vzeros
     else:
-        neg_inds = np.ones_like(
-            select_data()[axis_map_x[select_x_axis.value]], dtype=np.bool)
-        neg_inds[inds] = False
-        hhist1, _ = np.histogram(
-            select_data()[axis_map_x[select_x_axis.value]][inds], bins=hedges)
-        vhist1, _ = np.histogram(
-            select_data()[axis_map_y[select_y_axis.value]][inds], bins=vedges)
-        # hhist2, _ = np.histogram(
-        #     select_data()[axis_map_x[select_x_axis.value]][neg_inds], bins=hedges)
-        # vhist2, _ = np.histogram(
-        #     select_data()[axis_map_y[select_y_axis.value]][neg_inds], bins=vedges)
+        hhist1 = np.bincount(hbins[inds], minlength=10)
+        vhist1 = np.bincount(vbins[inds], minlength=10)
 
     hh1.data_source.data["top"] = hhist1
     # hh2.data_source.data["top"] = -hhist2
@@ -252,20 +317,13 @@ visualization_layout = column([row(inputs, layout)], sizing_mode="scale_both")
 # CORRELATION MATRIX
 
 # Adding the correlation matrix
-# Copy x-axis values into new df
-df_corr = df_catalysis_dataset[
-    ["CT", "Ar_flow", "CH4_flow", "O2_flow", "Total_flow", "Support_ID", "Temp",
-     "M2_mol", "M3_mol", "M1_atom_number", "M2_atom_number", "M3_atom_number",
-     "M1_mol_percentage", "M2_mol_percentage", "M3_mol_percentage"]
-]
-corr_matrix = df_corr.corr()
+# The matrix is static, so it is computed ahead of time by
+# build_correlation_matrix.py, one row per pair of parameters
+df_corr = pd.read_csv("catalysis_visualization/data/OCM-correlation.csv",
+                      float_precision="round_trip")
 
 # AXIS LABELS FOR PLOT
-df_corr = pd.DataFrame(corr_matrix)
-df_corr = df_corr.set_index(df_corr.columns).rename_axis('parameters', axis=1)
-df_corr.index.name = 'level_0'
-common_axes_val = list(df_corr.index)
-df_corr = pd.DataFrame(df_corr.stack(), columns=['correlation']).reset_index()
+common_axes_val = list(pd.unique(df_corr.level_0))
 source_corr = ColumnDataSource(df_corr)
 
 # FINDING LOWEST AND HIGHEST OF CORRELATION VALUES
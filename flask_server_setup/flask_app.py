@@ -1,44 +1,66 @@
 #flask app
 
-from flask import Flask, render_template
+from functools import lru_cache
+from hashlib import sha1
+from flask import Flask, render_template, make_response, request
 from bokeh.client import pull_session
 from bokeh.embed import server_document
 
 #instantiate the flask app
 app = Flask(__name__)
 
+#the script tag for a Bokeh app only depends on its url, so it is built once per url rather than on every request
+@lru_cache(maxsize=16)
+def cached_server_document(url):
+    return server_document(url=url)
+
+#each page only depends on its template, script tag and the script root that url_for prefixes links with, so it is
+#rendered once per mount point and served with an ETag that lets browsers revalidate their copy instead of downloading
+#the page again
+@lru_cache(maxsize=16)
+def cached_page(script_root, template, **context):
+    html=render_template(template, **context)
+    return html, sha1(html.encode()).hexdigest()
+
+def page(template, **context):
+    html, etag=cached_page(request.script_root, template, **context)
+    response=make_response(html)
+    response.set_etag(etag)
+    response.headers['Cache-Control']='public, max-age=60'
+    return response.make_conditional(request)
+
 #create index page function
 @app.route("/", methods=['GET'])
 def index():
-    return render_template("index.html")
+    return page("index.html")
 
 @app.route("/sliders_reaction_kinetics", methods=['GET'])
 def sliders_reaction_kinetics():
     #bokeh_script_sliders_reaction_kinetics = server_document(url="http://localhost:5006/sliders_reaction_kinetics")
-    bokeh_script_sliders_reaction_kinetics = server_document(url="https://srrweb.cc.lehigh.edu/sliders_reaction_kinetics")
-    return render_template("sliders_reaction_kinetics.html", bokeh_script_sliders_reaction_kinetics=bokeh_script_sliders_reaction_kinetics)
+    bokeh_script_sliders_reaction_kinetics = cached_server_document("https://srrweb.cc.lehigh.edu/sliders_reaction_kinetics")
+    return page("sliders_reaction_kinetics.html", bokeh_script_sliders_reaction_kinetics=bokeh_script_sliders_reaction_kinetics)
 
 @app.route("/ZECC", methods=['GET'])
 def ZECC():
     #bokeh_script_ZECC = server_document(url="http://localhost:5007/ZECC")
-    bokeh_script_ZECC = server_document(url="https://srrweb.cc.lehigh.edu/ZECC")
-    return render_template("ZECC.html", bokeh_script_ZECC=bokeh_script_ZECC)
+    bokeh_script_ZECC = cached_server_document("https://srrweb.cc.lehigh.edu/ZECC")
+    return page("ZECC.html", bokeh_script_ZECC=bokeh_script_ZECC)
 
 @app.route("/SIR", methods=['GET'])
 def SIR():
     #bokeh_script_SIR = server_document(url="http://localhost:5008/SIR")
-    bokeh_script_SIR = server_document(url="https://srrweb.cc.lehigh.edu/SIR")
-    return render_template("SIR.html", bokeh_script_SIR=bokeh_script_SIR)
+    bokeh_script_SIR = cached_server_document("https://srrweb.cc.lehigh.edu/SIR")
+    return page("SIR.html", bokeh_script_SIR=bokeh_script_SIR)
 
 @app.route("/catalysis_data_interactive_visualization", methods=['GET'])
 def catalysis_data_interactive_visualization():
     #bokeh_script_catalysis_data_interactive_visualization = server_document(url="http://localhost:5009/catalysis_data_interactive_visualization")
-    bokeh_script_catalysis_data_interactive_visualization = server_document(url="https://srrweb.cc.lehigh.edu/catalysis_data_interactive_visualization")
-    return render_template("catalysis.html", bokeh_script_catalysis_data_interactive_visualization=bokeh_script_catalysis_data_interactive_visualization)
+    bokeh_script_catalysis_data_interactive_visualization = cached_server_document("https://srrweb.cc.lehigh.edu/catalysis_data_interactive_visualization")
+    return page("catalysis.html", bokeh_script_catalysis_data_interactive_visualization=bokeh_script_catalysis_data_interactive_visualization)
 
 @app.route("/acknowledgements", methods=['GET'])
 def acknowledgements():
-    return render_template("acknowledgements.html")
+    return page("acknowledgements.html")
 
 #run the app
 if __name__ == "__main__":